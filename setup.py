@@ -47,6 +47,7 @@ setup(
         "rich-click>=1.6.1",
         "datetime>=5.1",
     ],
+    extras_require={"arrow": ["pyarrow"]},
     python_requires=">=3.10",
     classifiers=[
         "Development Status :: 4 - Beta",
@@ -10,7 +10,6 @@ import sys
 import rich_click as click
 from rich import print as rprint
 
-from .barcoding import process_vcf_files
 from .utils import (
     InputOutputValidator,
     combine_results,
@@ -44,7 +43,7 @@ CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
     "--output",
     "-o",
     type=click.Path(),
-    help="Write results to file [dim]['.txt', '.tsv', or '.csv']",
+    help="Write results to file [dim]['.txt', '.tsv', '.csv', '.feather', or '.parquet']",
 )
 @click.version_option(version, "-v", "--version", is_flag=True)
 @click.pass_context
@@ -56,6 +55,10 @@ def main(ctx, vcf_files, output):
     validator.validate_input()
     validator.validate_output()
 
+    # Imported only once the arguments are valid, so that --help and --version
+    # do not pay for loading the barcoding machinery
+    from .barcoding import process_vcf_files
+
     results_list = process_vcf_files(vcf_files)
 
     if not results_list:
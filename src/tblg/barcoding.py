@@ -1,9 +1,14 @@
 """Barcoding related functions"""
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
+import pandas as pd
 from tqdm.auto import tqdm
 
-from .levels import get_levels_data
-from .vcf import validate_vcf, vcf_to_dataframe
+from .levels import get_levels_data, snp_keys
+from .vcf import validate_vcf, vcf_to_arrays
 
 
 def lineage2_decision(call_list):
@@ -20,10 +25,11 @@ def lineage2_decision(call_list):
                     "L2.2 (modern)" is left unchanged.
     """
     lin2 = ["L2.2 (modern)", "L2.2 (ancient)"]
+    lin2_set = frozenset(lin2)
     alt_list = []
     for item in call_list:
-        if all(i in item for i in lin2):
-            item = list(set(item) - set(lin2))
+        if lin2_set.issubset(item):
+            item = list(set(item) - lin2_set)
             item.append(lin2[0])
         alt_list.append(item)
     return alt_list
@@ -43,10 +49,11 @@ def lineage4_decision(call_list, lin):
     Returns:
         List[List[str]]: A list of lists containing the alternate alleles for each sample at a given position.
     """
+    lin_set = frozenset(lin)
     alt_list = []
     for item in call_list:
-        if any(i in item for i in lin):
-            item = [x for x in item if x not in lin]
+        if not lin_set.isdisjoint(item):
+            item = [x for x in item if x not in lin_set]
         else:
             item.extend([lin[0] for i in range(2)])
         alt_list.append(item)
@@ -67,95 +74,80 @@ def count_variants(call_list, prefix=None):
     Returns:
         List[str]: A modified version of the input list, with variants possibly concatenated with a warning message or removed.
     """
-    d = {}
-    for item in call_list:
-        if item:
-            caseless = item.casefold()
-            if caseless in d:
-                d[caseless][1] += 1
-            else:
-                d[caseless] = [item, 1]
-
-    call_list = []
-    for item, count in d.values():
-        if not item.startswith(prefix) if prefix else True:
-            item = f"{item}" if count > 1 else f"{item}*"
-        call_list.append(item)
-
-    return call_list
-
-
-def barcoding(uploaded_vcf, use_tqdm=False):
+    items = [item for item in call_list if item]
+    caseless = list(map(str.casefold, items))
+    counts = Counter(caseless)
+    # Keep the original casing of the first occurrence of each variant
+    first = dict(zip(reversed(caseless), reversed(items)))
+    variants = ((first[key], count) for key, count in counts.items())
+
+    # Only check the prefix when one is given
+    if not prefix:
+        return [item if count > 1 else f"{item}*" for item, count in variants]
+    return [
+        item if count > 1 or item.startswith(prefix) else f"{item}*"
+        for item, count in variants
+    ]
+
+
+def call_lineages(vcf_id, sample, pos, ref, alt):
     """
-    Perform barcoding of a VCF file uploaded by the user.
+    Call lineages for the samples of one or more VCF files.
 
     Parameters:
     -----------
-    uploaded_vcf : str
-        The file path or name of the uploaded VCF file.
-    use_tqdm : bool, optional
-        Whether or not to use tqdm to display progress bar (default is False).
+    vcf_id : numpy.ndarray
+        The index of the VCF file each row was read from.
+    sample, pos, ref, alt : numpy.ndarray
+        The sample names, positions, reference alleles, and alternative alleles of the rows,
+        as returned by `vcf_to_arrays`.
 
     Returns:
     --------
     pandas.DataFrame
-        A dataframe containing barcoding analysis results for each sample.
+        A dataframe containing the VCF file index, the sample name, and the lineages of each level
+        for each sample, sorted by level.
     """
-    # Convert VCF to DataFrame
-    df = vcf_to_dataframe(uploaded_vcf, use_tqdm=use_tqdm)
-
-    # Get levels dictionary and create a list of level names
-    levels = get_levels_data()[0]
-    level_names = [f"level_{i+1}" for i in range(len(levels))]
-
-    # Define a function to compute the level of each sample
-    def compute_level(level):
-        """
-        The compute_level function takes a level tuple and computes the level for
-        each sample in a DataFrame based on the values of "POS", "REF", and "ALT"
-        columns of the DataFrame. It returns an array of levels for each sample.
-
-        Parameters:
-        -----------
-        level: A tuple containing four elements
-            - the position (POS), reference allele (REF), alternate allele (ALT)
-            and the level number. This tuple represents a single level.
-        Returns:
-        --------
-        levels: A numpy array containing the level number for each sample in the DataFrame.
-        Note: This function assumes that the input DataFrame df has columns named "POS", "REF", and "ALT".
-        """
-        exp = (
-            df["POS"].values[:, None],
-            df["REF"].values[:, None],
-            df["ALT"].values[:, None],
-        )
-        mask = np.logical_and.reduce(
-            [
-                np.equal(exp[0], level[0]),
-                np.equal(exp[1], level[1]),
-                np.equal(exp[2], level[2]),
-            ]
-        )
-        return np.dot(mask, level[3])
-
-    # Compute the level of each sample for each level
-    for i, level in (
-        enumerate(tqdm(levels, desc="Processing levels", colour="blue"))
-        if use_tqdm
-        else enumerate(levels)
-    ):
-        df[level_names[i]] = compute_level(level)
-
-    # Drop the columns REF, ALT, and POS and replace empty strings with NaN
-    df.drop(["REF", "ALT", "POS"], axis=1, inplace=True)
-    df.replace("", np.nan, inplace=True)
-
-    # Group the data by sample and concatenate the level columns into comma-separated strings
-    df = df.groupby(["Sample"]).agg(lambda x: ",".join(x.dropna())).reset_index()
+    # Get levels data and create a list of level names
+    levels_df = get_levels_data()[0]
+    level_ids = range(1, 6)
+    level_names = [f"level_{i}" for i in level_ids]
+
+    samples = pd.MultiIndex.from_frame(
+        pd.DataFrame({"vcf_id": vcf_id, "Sample": sample})
+        .drop_duplicates()
+        .sort_values(["vcf_id", "Sample"])
+    )
+
+    # Look up the packed "POS", "REF", and "ALT" of every row in the sorted keys of all levels
+    # at once, keeping only the matching rows, in the order of the VCF
+    keys = snp_keys(pos, ref, alt)
+    level_keys = levels_df["key"].to_numpy()
+    idx = np.searchsorted(level_keys, keys).clip(max=len(level_keys) - 1)
+    hit = (keys >= 0) & (level_keys[idx] == keys)
+    matches = pd.DataFrame(
+        {
+            "vcf_id": vcf_id[hit],
+            "Sample": sample[hit],
+            "level": levels_df["level"].to_numpy()[idx[hit]],
+            "lineage": levels_df["lineage"].to_numpy()[idx[hit]],
+        }
+    )
+
+    # Group the matches by sample and level, concatenate the lineages into comma-separated
+    # strings, and spread the levels into columns
+    df = (
+        matches.groupby(["vcf_id", "Sample", "level"], sort=False)["lineage"]
+        .agg(",".join)
+        .unstack("level", fill_value="")
+        .reindex(index=samples, columns=level_ids, fill_value="")
+    )
+    df.columns = level_names
+    df = df.reset_index()
 
     # Split the first two level columns into lists and apply lineage decision and count variants functions
-    df[level_names[:2]] = df[level_names[:2]].applymap(lambda x: x.split(","))
+    for col in level_names[:2]:
+        df[col] = df[col].str.split(",")
     df[level_names[0]] = lineage4_decision(df[level_names[0]], ["L4"])
     df[level_names[1]] = lineage4_decision(df[level_names[1]], ["L4.9"])
     df[level_names[0]] = df[level_names[0]].apply(count_variants, prefix="L8")
@@ -165,7 +157,8 @@ def barcoding(uploaded_vcf, use_tqdm=False):
     df[level_names[1]] = lineage2_decision(df[level_names[1]])
 
     # Convert the first two level columns back to comma-separated strings
-    df[level_names[:2]] = df[level_names[:2]].applymap(lambda x: ", ".join(map(str, x)))
+    for col in level_names[:2]:
+        df[col] = df[col].map(", ".join)
 
     # Sort the dataframe by level and reset the index
     df.sort_values(level_names, inplace=True)
@@ -175,6 +168,37 @@ def barcoding(uploaded_vcf, use_tqdm=False):
     return df
 
 
+def barcoding(uploaded_vcf, use_tqdm=False):
+    """
+    Perform barcoding of a VCF file uploaded by the user.
+
+    Parameters:
+    -----------
+    uploaded_vcf : str
+        The file path or name of the uploaded VCF file.
+    use_tqdm : bool, optional
+        Whether or not to use tqdm to display progress bar (default is False).
+
+    Returns:
+    --------
+    pandas.DataFrame
+        A dataframe containing barcoding analysis results for each sample.
+    """
+    sample, pos, ref, alt = vcf_to_arrays(uploaded_vcf, use_tqdm=use_tqdm)
+    vcf_id = np.zeros(len(sample), dtype=np.int64)
+    return call_lineages(vcf_id, sample, pos, ref, alt).drop(columns="vcf_id")
+
+
+def _read_one(vcf_file):
+    """
+    Validate and read a single VCF file in a worker process.
+    Returns None if the file is not a valid VCF file.
+    """
+    if validate_vcf(vcf_file):
+        return vcf_to_arrays(vcf_file, use_tqdm=False)
+    return None
+
+
 def process_vcf_files(vcf_files):
     """
     Process one or more VCF files and return a list of dataframes containing results
@@ -187,28 +211,40 @@ def process_vcf_files(vcf_files):
         if validate_vcf(vcf_file):
             out = barcoding(vcf_file, use_tqdm=True)
             results_list.append(out)
-
-    # If more than one VCF file is supplied, process each file and display a progress bar
-    else:
-        with tqdm(total=len(vcf_files), desc="Processing files", colour="blue") as pbar:
-            for vcf_file in vcf_files:
-                if validate_vcf(vcf_file):
-                    out = barcoding(vcf_file, use_tqdm=False)
-                    if (
-                        out.empty
-                        or all(
-                            out.loc[:, out.columns != "Sample"]
-                            .replace("", np.nan)
-                            .isna()
-                            .all()
-                        )
-                        is True
-                    ):
-                        tqdm.write(
-                            f"{vcf_file} does not have any genotyping SNPs. Skipping..."
-                        )
-                    else:
-                        results_list.append(out)
-                pbar.update(1)
+        return results_list
+
+    # If more than one VCF file is supplied, read the files in parallel and display a progress bar
+    valid_ids, arrays = [], []
+    max_workers = min(os.cpu_count() or 1, len(vcf_files))
+    with ProcessPoolExecutor(max_workers=max_workers) as ex, tqdm(
+        total=len(vcf_files), desc="Processing files", colour="blue"
+    ) as pbar:
+        for vcf_id, out in enumerate(ex.map(_read_one, vcf_files)):
+            # validate_vcf has already reported why an invalid file was skipped
+            if out is not None:
+                valid_ids.append(vcf_id)
+                arrays.append((np.full(len(out[0]), vcf_id, dtype=np.int64), *out))
+            pbar.update(1)
+
+    if not arrays:
+        return results_list
+
+    # Call the lineages of all files at once and split the results by file
+    results = call_lineages(*(np.concatenate(column) for column in zip(*arrays)))
+    results_by_file = dict(tuple(results.groupby("vcf_id", sort=False)))
+
+    for vcf_id in valid_ids:
+        out = results_by_file.get(vcf_id, results.iloc[:0])
+        out = out.drop(columns="vcf_id").reset_index(drop=True)
+        if (
+            out.empty
+            or all(out.loc[:, out.columns != "Sample"].replace("", np.nan).isna().all())
+            is True
+        ):
+            tqdm.write(
+                f"{vcf_files[vcf_id]} does not have any genotyping SNPs. Skipping..."
+            )
+        else:
+            results_list.append(out)
 
     return results_list
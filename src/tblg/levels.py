@@ -1,48 +1,98 @@
 """Process levels.tsv file"""
+from functools import lru_cache
 from importlib.resources import files
 
+import numpy as np
 import pandas as pd
 
+# Integer codes of the nucleotides used to pack SNPs into single integer keys
+NUCLEOTIDES = {"A": 0, "C": 1, "G": 2, "T": 3}
 
+
+def snp_keys(pos, ref, alt):
+    """
+    Pack the position, the reference allele, and the alternative allele of each SNP
+    into a single integer key, so that SNPs can be joined on one integer column instead
+    of three object columns.
+
+    Parameters:
+    ----------
+    pos : array-like
+        The positions of the SNPs.
+    ref : array-like
+        The reference alleles of the SNPs.
+    alt : array-like
+        The alternative alleles of the SNPs.
+
+    Returns:
+    -------
+    keys : np.ndarray
+        An int64 array with one key per SNP, or -1 where the reference or the alternative
+        allele is not a single nucleotide.
+    """
+    pos = np.asarray(pos, dtype=np.int64)
+    ref_code = _nucleotide_codes(ref)
+    alt_code = _nucleotide_codes(alt)
+    valid = (ref_code >= 0) & (alt_code >= 0)
+
+    keys = np.full(len(pos), -1, dtype=np.int64)
+    keys[valid] = (pos[valid] << 4) | (ref_code[valid] << 2) | alt_code[valid]
+    return keys
+
+
+def _nucleotide_codes(alleles):
+    """
+    Encode alleles as nucleotide codes, or -1 if an allele is not a single nucleotide.
+    The alleles are factorized first, so that each unique allele is only looked up once.
+    """
+    codes, uniques = pd.factorize(pd.Series(alleles))
+    lookup = np.array([NUCLEOTIDES.get(u, -1) for u in uniques] + [-1], dtype=np.int64)
+    # Missing alleles are factorized to -1, which picks the trailing -1 of the lookup
+    return lookup[codes]
+
+
+@lru_cache(maxsize=1)
 def get_levels_data():
     """
-    Read the data from a TSV file containing information about barcoding levels, and extract the relevant data
-    for each level. The data for each level is then stored in a tuple of NumPy arrays, where each array
-    contains the position, the reference allele, the alternative allele, and the lineage for each row in the data.
+    Read the data from a TSV file containing information about barcoding levels. The data for all levels
+    is kept in a single long DataFrame, where each row contains the position, the reference allele,
+    the alternative allele, the lineage, and the level of a barcoding SNP.
     Additionally, the function returns an array of positional data that is common to all levels.
 
+    The file is read only once per process and the cached results are shared between callers,
+    so they must not be modified.
+
 
     Returns:
     -------
-    levels_data : Tuple[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray], np.ndarray]
-        A tuple of NumPy arrays, where each sub-tuple contains the data for a different level. Each sub-tuple
-        contains four arrays representing the position, the reference allele, the alternative allele,
-        and the lineage for each row in the data.
+    levels_df : pd.DataFrame
+        A DataFrame with columns "key", "lineage", and "level", containing the barcoding SNPs for
+        levels 1 through 5, sorted by "key", which packs the position and the alleles of a SNP
+        (see `snp_keys`).
     pos : np.ndarray
-        An array containing the position for all SNPs.
+        A read-only array containing the position for all SNPs.
     """
     levels_file = files("tblg.data").joinpath("levels.tsv")
     temp_df = pd.read_csv(levels_file, sep="\t")
-    unique_levels = temp_df["level"].unique()
-    levels_dict = {}
-
-    # For each unique level value, extract the relevant data and store it in the dictionary
-    for elem in unique_levels:
-        levels_dict[elem] = temp_df[temp_df["level"] == elem][
-            ["POS", "REF", "ALT", "lineage"]
-        ]
-
-    # Create a tuple of NumPy arrays, where each array contains the data for a different level
-    # Each array contains the positional data, the reference allele, the alternative allele,
-    # and the lineage (i.e., the level value) for each row in the data
-    # The tuple contains data for levels 1 through 5
-    levels_data = tuple(
-        levels_dict.get(i, pd.DataFrame())[["POS", "REF", "ALT", "lineage"]]
-        .to_numpy()
-        .T
-        for i in range(1, 6)
+
+    # Keep the data for levels 1 through 5 in one table, so it can be joined
+    # against a VCF in a single lookup of the packed positional and allele data
+    levels_df = temp_df.loc[
+        temp_df["level"].between(1, 5), ["POS", "REF", "ALT", "lineage", "level"]
+    ].reset_index(drop=True)
+    levels_df.insert(
+        0, "key", snp_keys(levels_df["POS"], levels_df["REF"], levels_df["ALT"])
     )
+    # Keys of -1 also stand for missing alleles in a VCF, so every SNP must have a valid key
+    if (levels_df["key"] < 0).any():
+        raise ValueError("levels.tsv must only contain single-nucleotide REF and ALT alleles")
+    levels_df.drop(["POS", "REF", "ALT"], axis=1, inplace=True)
+    levels_df.sort_values("key", inplace=True, ignore_index=True)
+    # Each VCF row is looked up once in the sorted keys, so a SNP may only belong to one level
+    if levels_df["key"].duplicated().any():
+        raise ValueError("levels.tsv must not assign the same SNP to more than one level")
 
-    pos = temp_df["POS"].values
+    pos = temp_df["POS"].to_numpy()
+    pos.setflags(write=False)
 
-    return levels_data, pos
+    return levels_df, pos
@@ -1,11 +1,17 @@
 """Various helper functions"""
 import codecs
+import csv
 import datetime
+import io
 import logging
 import os
 import os.path
 import signal
+import sys
+from contextlib import contextmanager
+from importlib.util import find_spec
 
+import numpy as np
 import pandas as pd
 import rich_click as click
 from rich import print as rprint
@@ -25,6 +31,8 @@ rhandler = RichHandler(
 logging.basicConfig(level="NOTSET", format=FORMAT, datefmt="[%X]", handlers=[rhandler])
 log = logging.getLogger("rich")
 
+OUTPUT_EXTENSIONS = (".txt", ".tsv", ".csv", ".feather", ".parquet")
+
 
 def combine_results(results_list):
     """
@@ -33,10 +41,19 @@ def combine_results(results_list):
     if not results_list:
         return pd.DataFrame()
 
-    results = pd.concat(results_list, ignore_index=True)
-    results = results.sort_values(
-        by=["level_1", "level_2", "level_3", "level_4", "level_5"]
-    ).reset_index(drop=True)
+    # A single dataframe does not need to be concatenated
+    if len(results_list) == 1:
+        results = results_list[0]
+    else:
+        results = pd.concat(results_list, ignore_index=True)
+
+    # Sort by the levels with a stable lexsort of their sorted factor codes, where np.lexsort
+    # uses the last key as the primary one and missing values are sorted last
+    keys = []
+    for col in ["level_5", "level_4", "level_3", "level_2", "level_1"]:
+        codes = pd.factorize(results[col], sort=True)[0]
+        keys.append(np.where(codes < 0, len(codes), codes))
+    results = results.take(np.lexsort(keys)).reset_index(drop=True)
 
     return results
 
@@ -56,34 +73,176 @@ def handle_timeout(signum, frame):
     raise TimeoutException()
 
 
-def get_new_output_path(output):
+@contextmanager
+def alarm_timeout(seconds):
+    """
+    A context manager that raises a TimeoutException if its body runs longer than the given
+    number of seconds. The previous SIGALRM handler is restored on exit.
+    """
+    previous_handler = signal.signal(signal.SIGALRM, handle_timeout)
+    signal.alarm(seconds)
+    try:
+        yield
+    finally:
+        signal.alarm(0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+def get_new_output_path(output, attempt=0):
     """
     A function that generates a new output path with a timestamp in the filename.
 
     Args:
         output (str): The original output path.
+        attempt (int): The number of paths already taken, appended to the timestamp if not 0.
 
     Returns:
         str: The new output path with a timestamp in the filename.
     """
     now = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    if attempt:
+        now = f"{now}-{attempt}"
     basename = os.path.basename(output)
     new_basename = f"{now}_{basename}"
     directory = os.path.dirname(output) if os.path.dirname(output) else os.getcwd()
-    new_output = os.path.join(directory, new_basename)
-    return os.path.splitext(new_output)[0] + ".tsv"
+    return os.path.join(directory, new_basename)
+
+
+def write_table(results, path, sep, mode="w"):
+    """
+    A function that writes a dataframe to a delimited text file through a buffered csv writer.
+
+    Args:
+        results (pandas.DataFrame): The dataframe to be written to a file.
+        path (str): The path of the output file.
+        sep (str): The field delimiter, e.g. ',' or '\\t'.
+        mode (str): The mode to open the file in, 'w' to overwrite or 'x' to only create a new file.
+
+    Returns:
+        None
+    """
+    with open(path, mode, newline="", buffering=1 << 20) as f:
+        writer = csv.writer(f, delimiter=sep, lineterminator="\n")
+        writer.writerow(results.columns)
+        writer.writerows(results.itertuples(index=False, name=None))
+
+
+def write_output(results, output, mode="w"):
+    """
+    A function that writes a dataframe containing results to a file in the format given by its extension.
+
+    Args:
+        results (pandas.DataFrame): The dataframe containing the results to be written to a file.
+        output (str): The path of the output file.
+        mode (str): The mode to open the file in, 'w' to overwrite or 'x' to only create a new file.
+
+    Raises:
+        ValueError: If the output file extension is not '.csv', '.tsv', '.txt', '.feather', or '.parquet'.
+        FileExistsError: If mode is 'x' and the output file already exists.
+
+    Returns:
+        None
+    """
+    ext = os.path.splitext(output)[1]
+    if ext == ".csv":
+        write_table(results, output, ",", mode)
+    elif ext == ".tsv" or ext == ".txt":
+        write_table(results, output, "\t", mode)
+    elif ext == ".feather" or ext == ".parquet":
+        # Serialize first, so that no file is created if pyarrow is missing
+        buffer = io.BytesIO()
+        if ext == ".feather":
+            results.to_feather(buffer)
+        else:
+            results.to_parquet(buffer, compression="zstd")
+        with open(output, f"{mode}b") as f:
+            f.write(buffer.getvalue())
+    else:
+        raise ValueError(
+            "Output file must have 'txt', 'tsv', 'csv', 'feather', or 'parquet' extension"
+        )
+
+
+def save_as_new_output(results, output):
+    """
+    A function that writes a dataframe containing results to a new timestamped file
+    in the same format, next to an output file that already exists.
+
+    Args:
+        results (pandas.DataFrame): The dataframe containing the results to be written to a file.
+        output (str): The path of the existing output file.
+
+    Returns:
+        None
+    """
+    # The timestamp only has a resolution of one second, so create the file exclusively
+    # and try another name if a file with the same timestamp already exists
+    attempt = 0
+    while True:
+        new_output = get_new_output_path(output, attempt)
+        try:
+            write_output(results, new_output, mode="x")
+            break
+        except FileExistsError:
+            attempt += 1
+    rprint(f"[yellow bold]Saving as[/] [italic]{new_output}")
+
+
+def confirm_overwrite(results, output):
+    """
+    A function that asks the user whether an existing output file should be overwritten.
+    If not, or if the user does not answer in time or cannot be asked, the results are
+    saved to a new timestamped file instead.
+
+    Args:
+        results (pandas.DataFrame): The dataframe containing the results to be written to a file.
+        output (str): The path of the existing output file.
+
+    Returns:
+        bool: True if the existing output file should be overwritten, False otherwise.
+    """
+    # Nobody can answer the prompt without an interactive terminal, so keep the existing file
+    if not sys.stdin.isatty():
+        save_as_new_output(results, output)
+        return False
+
+    while True:
+        try:
+            with alarm_timeout(60):
+                user_input = Prompt.ask(
+                    f"[yellow bold]File[/] [cyan italic]{output}[/] [yellow bold]already exists.\n"
+                    f"Do you want to overwrite it? [cyan bold]\\[y/n][/] [dim]Press [italic]ENTER[/] to exit",
+                )
+
+            if user_input.lower() == "y":
+                rprint(f"[yellow bold]Overwriting[/] [italic]{output}")
+                return True
+            elif user_input.lower() == "n":
+                save_as_new_output(results, output)
+                return False
+            elif not user_input.strip():
+                raise KeyboardInterrupt
+            else:
+                rprint(
+                    "[red bold]Invalid input.[/] [yellow]Please enter [italic]'y'[/] or [italic]'n'[/]."
+                )
+
+        except TimeoutException:
+            rprint("\n[red bold]Timeout exceeded.[/]")
+            save_as_new_output(results, output)
+            return False
 
 
 def write_results_to_file(results, output):
     """
-    A function that writes a dataframe containing results to a file in CSV or TSV format.
+    A function that writes a dataframe containing results to a file in CSV, TSV, Feather, or Parquet format.
 
     Args:
         results (pandas.DataFrame): The dataframe containing the results to be written to a file.
         output (str): The path of the output file.
 
     Raises:
-        ValueError: If the output file extension is not '.csv', '.tsv', or '.txt'.
+        ValueError: If the output file extension is not '.csv', '.tsv', '.txt', '.feather', or '.parquet'.
         OSError: If the output file cannot be created due to an operating system error.
 
     Returns:
@@ -95,49 +254,19 @@ def write_results_to_file(results, output):
     output = os.path.abspath(output)
     output_dir = os.path.dirname(output)
 
-    if os.path.exists(output):
-        while True:
-            try:
-                signal.signal(signal.SIGALRM, handle_timeout)
-                signal.alarm(60)
-                user_input = Prompt.ask(
-                    f"[yellow bold]File[/] [cyan italic]{output}[/] [yellow bold]already exists.\n"
-                    f"Do you want to overwrite it? [cyan bold]\[y/n][/] [dim]Press [italic]ENTER[/] to exit",
-                )
-                signal.alarm(0)
-
-                if user_input.lower() == "y":
-                    rprint(f"[yellow bold]Overwriting[/] [italic]{output}")
-                    break
-                elif user_input.lower() == "n":
-                    new_output = get_new_output_path(output)
-                    results.to_csv(new_output, index=False, sep="\t")
-                    rprint(f"[yellow bold]Saving as[/] [italic]{new_output}")
-                    return
-                elif not user_input.strip():
-                    raise KeyboardInterrupt
-                else:
-                    rprint(
-                        "[red bold]Invalid input.[/] [yellow]Please enter [italic]'y'[/] or [italic]'n'[/]."
-                    )
-
-            except TimeoutException:
-                rprint("\n[red bold]Timeout exceeded.[/]")
-                new_output = get_new_output_path(output)
-                results.to_csv(new_output, index=False, sep="\t")
-                rprint(f"[yellow bold]Saving as[/] [italic]{new_output}")
-                return
-
     try:
         os.makedirs(output_dir, exist_ok=True)
 
-        ext = os.path.splitext(output)[1]
-        if ext == ".csv":
-            results.to_csv(output, index=False)
-        elif ext == ".tsv" or ext == ".txt":
-            results.to_csv(output, index=False, sep="\t")
-        else:
-            raise ValueError("Output file must have 'txt', 'tsv', or 'csv' extension")
+        # Create the file only if it does not exist yet, instead of checking for it first
+        try:
+            write_output(results, output, mode="x")
+        except FileExistsError:
+            if confirm_overwrite(results, output):
+                write_output(results, output, mode="w")
+    except ImportError:
+        log.error(
+            "Writing '.feather' or '.parquet' files requires the 'pyarrow' package. Please install it with 'pip install tblg[arrow]'."
+        )
     except OSError as e:
         if e.errno == 30:
             log.error(
@@ -211,14 +340,26 @@ class InputOutputValidator:
         -------
         click.exceptions.ClickException:
             If output file doesn't have valid extension or help flag is set.
+            Exits with status 1 if a Feather or Parquet output is requested without 'pyarrow'.
         """
-        if self.output and not self.output.endswith((".txt", ".tsv", ".csv")):
+        if self.output and not self.output.endswith(OUTPUT_EXTENSIONS):
             rprint(
-                "[red bold]ATTENTION[/]: [italic]Output file must have 'txt', 'tsv', or 'csv' extension",
+                "[red bold]ATTENTION[/]: [italic]Output file must have 'txt', 'tsv', 'csv', 'feather', or 'parquet' extension",
             )
             click.echo(self.ctx.get_help())
             self.ctx.exit()
 
+        elif (
+            self.output
+            and self.output.endswith((".feather", ".parquet"))
+            and not find_spec("pyarrow")
+        ):
+            rprint(
+                "[red bold]ATTENTION[/]: [italic]Writing '.feather' or '.parquet' files requires the 'pyarrow' package. "
+                "Please install it with 'pip install tblg\\[arrow]'",
+            )
+            self.ctx.exit(1)
+
         elif self.output:
             rprint(f"[yellow bold]Writing results to[/] [cyan italic]{self.output}[/]")
 
@@ -7,6 +7,32 @@ from tqdm import tqdm
 
 from .levels import get_levels_data
 
+# The fixed columns of a VCF file, followed by one column per sample
+VCF_COLUMNS = ["CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "FORMAT"]
+
+
+def _first_data_line(f, block_size=65536):
+    """
+    Return the first line of a VCF file opened in binary mode that is not a header line,
+    or None if the file has no such line. A single block is read, and the file is only
+    iterated line by line if the header does not fit into that block.
+    """
+    block = f.read(block_size)
+    lines = block.split(b"\n")
+    if len(block) == block_size:
+        # The last line may continue past the block, so complete it from the file
+        lines[-1] += f.readline()
+    if not lines[-1]:
+        lines.pop()
+
+    for line in lines:
+        if not line.startswith(b"#"):
+            return line
+    for line in f:
+        if not line.startswith(b"#"):
+            return line
+    return None
+
 
 def validate_vcf(vcf_file):
     """
@@ -15,41 +41,27 @@ def validate_vcf(vcf_file):
     Returns True if the file has typical VCF structure, and False otherwise.
     """
     if vcf_file.endswith(".vcf.gz"):
-        with gzopen(vcf_file, "rb") as f:
-            for line in f:
-                line = line.decode("utf-8")
-                if line.startswith("#"):
-                    continue
-                else:
-                    fields = line.strip().split("\t")
-                    if len(fields) < 8:
-                        tqdm.write(
-                            f"{vcf_file} does not have typical VCF structure. Skipping..."
-                        )
-                        return False
-                    else:
-                        return True
+        opener = gzopen
     elif vcf_file.endswith(".vcf"):
-        with open(vcf_file) as f:
-            for line in f:
-                if line.startswith("#"):
-                    continue
-                else:
-                    fields = line.strip().split("\t")
-                    if len(fields) < 8:
-                        tqdm.write(
-                            f"{vcf_file} does not have typical VCF structure. Skipping..."
-                        )
-                        return False
-                    else:
-                        return True
+        opener = open
     else:
         tqdm.write(f"{vcf_file} does not end with .vcf or .vcf.gz. Skipping...")
+        return None
 
+    with opener(vcf_file, "rb") as f:
+        line = _first_data_line(f)
 
-def vcf_to_dataframe(file, use_tqdm=False):
+    if line is None:
+        return None
+    if line.strip().count(b"\t") < 7:
+        tqdm.write(f"{vcf_file} does not have typical VCF structure. Skipping...")
+        return False
+    return True
+
+
+def vcf_to_arrays(file, use_tqdm=False):
     """
-    Reads a VCF file and returns a Pandas DataFrame containing the sample names, position,
+    Reads a VCF file and returns NumPy arrays containing the sample names, position, reference allele,
     and alternative allele for each sample in the VCF file.
 
     Parameters:
@@ -62,65 +74,117 @@ def vcf_to_dataframe(file, use_tqdm=False):
 
     Returns:
     -------
-    df : pd.DataFrame
-        A Pandas DataFrame containing the sample names, positional data, and allele data for each sample
-        in the VCF file. The DataFrame is filtered to only include rows with positions that are present in
+    sample, pos, ref, alt : Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+        Arrays containing the sample names, positional data (int64), and allele data for each sample
+        in the VCF file. The arrays are filtered to only include positions that are present in
         the levels data extracted from the levels.tsv file.
     """
     pos_all = get_levels_data()[1]
 
     opener = gzopen if file.endswith(".gz") else open
 
+    # Find the first header line and extract the sample names from it
     with opener(file, "rt") as f:
-        # Remove all header lines from the input file
-        lines = [line.strip() for line in f if not line.startswith("##")]
-
-    # Extract the sample names from the first header line
-    header = lines.pop(0).split("\t")[9:]
-
-    # Extract data from each line of the input file and convert it to a list
-    data = []
-
-    if use_tqdm:
-        pbar = tqdm(total=len(lines), desc="Reading VCF files", colour="blue")
-    for i, line in enumerate(lines):
-        fields = line.split("\t")
-        pos, ref, alt = fields[1], fields[3], fields[4]
-        alleles = [ref] + alt.split(",")
-        genotypes = [genotype.split(":") for genotype in fields[9:]]
-
-        for i, gt in enumerate(genotypes):
-            if gt[0] == "." or gt[0] == "./." or gt[0] == ".|.":
-                allele = np.nan
-            elif "/" in gt[0]:
-                alleles_list = [
-                    alleles[int(x)] if x != "." else np.nan for x in gt[0].split("/")
-                ]
-                allele = "/".join([x for x in alleles_list if str(x) != "nan"])
-            elif "|" in gt[0]:
-                alleles_list = [
-                    alleles[int(x)] if x != "." else np.nan for x in gt[0].split("|")
-                ]
-                allele = "|".join([x for x in alleles_list if str(x) != "nan"])
-            else:
-                allele = alleles[int(gt[0])]
-            data.append([header[i], pos, ref, allele])
-        if use_tqdm:
-            pbar.update(1)
-    if use_tqdm:
-        pbar.close()
-
-    # Convert the list of data to a Pandas DataFrame
-    df = pd.DataFrame(data, columns=["Sample", "POS", "REF", "ALT"])
-
-    # Set the data types for each column in the DataFrame
-    df = df.astype(
-        {"Sample": "object", "REF": "object", "ALT": "object", "POS": "int64"}
+        for n_header, line in enumerate(f):
+            if not line.startswith("##"):
+                break
+    columns = line.strip().split("\t")
+    header = columns[len(VCF_COLUMNS) :]
+    n_samples = len(header)
+
+    # A sites-only VCF has no FORMAT and sample columns, so there are no genotypes to read
+    if n_samples == 0:
+        empty = np.array([], dtype=object)
+        return empty, np.array([], dtype=np.int64), empty.copy(), empty.copy()
+
+    # Read the POS, REF, ALT, and genotype columns in chunks, keeping only the variants at
+    # positions that are present in the levels data before expanding the genotypes
+    # Columns are named by their position rather than by the header, as sample names do not
+    # have to be unique and the fixed column names are not always spelled as in the spec
+    samples = [f"sample_{i}" for i in range(n_samples)]
+    reader = pd.read_csv(
+        file,
+        sep="\t",
+        header=None,
+        skiprows=n_header + 1,
+        names=[*VCF_COLUMNS[: len(columns) - n_samples], *samples],
+        usecols=["POS", "REF", "ALT", *samples],
+        dtype={"POS": np.int64, "REF": str, "ALT": str, **dict.fromkeys(samples, str)},
+        na_filter=False,
+        engine="c",
+        chunksize=10_000,
     )
-    # Strip "/" and "|" from ALT column
-    df["ALT"] = df["ALT"].str.split(r"[/|]").str[-1]
+    # The number of variants is not known before the file is read, so the progress bar
+    # counts the variants read so far rather than the chunks, without a total
+    pbar = tqdm(
+        desc="Reading VCF files", unit=" variants", colour="blue", disable=not use_tqdm
+    )
+    chunks = []
+    for chunk in reader:
+        chunks.append(chunk[chunk["POS"].isin(pos_all)])
+        pbar.update(len(chunk))
+    pbar.close()
+    body = pd.concat(chunks, ignore_index=True)
+
+    # Expand the variants into one row per variant and sample, in the order of the VCF
+    n_variants = len(body)
+    sample = np.tile(np.array(header, dtype=object), n_variants)
+    pos = np.repeat(body["POS"].to_numpy(dtype=np.int64), n_samples)
+    ref = np.repeat(body["REF"].to_numpy(dtype=object), n_samples)
+    rows = np.repeat(np.arange(n_variants), n_samples)
+
+    # Take the genotype from each sample field and the index of its last called allele
+    gt = pd.Series(body[samples].to_numpy(dtype=object).ravel(), dtype=object)
+    gt = gt.str.split(":", n=1).str[0]
+    # Genotypes repeat a lot across variants and samples, so parse each distinct one once
+    codes, genotypes = pd.factorize(gt)
+    genotypes = pd.Series(genotypes, dtype=object)
+    missing = genotypes.isin([".", "./.", ".|."]).to_numpy()[codes]
+    # The last allele index that is followed only by missing (".") alleles
+    allele_idx = pd.to_numeric(
+        genotypes.str.extract(r"(\d+)(?:[/|]\.)*$", expand=False), errors="coerce"
+    ).to_numpy()[codes]
+    called = ~np.isnan(allele_idx)
+
+    # Look up the called alleles among the reference and alternative alleles of each variant
+    # Most variants are biallelic, so the alternative alleles are only split when needed
+    if body["ALT"].str.contains(",", regex=False).any():
+        alt_alleles = body["ALT"].str.split(",", expand=True).to_numpy(dtype=object)
+    else:
+        alt_alleles = body[["ALT"]].to_numpy(dtype=object)
+    alleles = np.column_stack([body["REF"].to_numpy(dtype=object), alt_alleles])
+    alt = np.full(len(gt), "", dtype=object)
+    alt[called] = alleles[rows[called], allele_idx[called].astype(np.int64)]
+    alt[missing] = np.nan
+
+    return sample, pos, ref, alt
+
+
+def vcf_to_dataframe(file, use_tqdm=False):
+    """
+    Reads a VCF file and returns a Pandas DataFrame containing the sample names, position,
+    and alternative allele for each sample in the VCF file. Barcoding reads the arrays from
+    `vcf_to_arrays` directly, so this function is only kept for external callers.
+
+    Parameters:
+    ----------
+    file : str
+        The name of the VCF file to read. The file can be compressed with gzip.
+    use_tqdm : bool, optional
+        A flag that indicates whether or not to display a progress bar during the reading process.
+        Default is False.
+
+    Returns:
+    -------
+    df : pd.DataFrame
+        A Pandas DataFrame containing the sample names, positional data, and allele data for each sample
+        in the VCF file. The DataFrame is filtered to only include rows with positions that are present in
+        the levels data extracted from the levels.tsv file.
+    """
+    sample, pos, ref, alt = vcf_to_arrays(file, use_tqdm=use_tqdm)
+    df = pd.DataFrame({"Sample": sample, "POS": pos, "REF": ref, "ALT": alt})
 
-    # Filter the DataFrame to only include rows with positions in the pos_all list
-    df = df[df["POS"].isin(pos_all)].reset_index(drop=True)
-    # Return the filtered DataFrame
+    # Store the sample names and alleles as categoricals, as they repeat for every variant
+    # and for every sample of a variant respectively
+    df = df.astype({"Sample": "category", "REF": "category", "ALT": "category"})
     return df